@@ -38,14 +38,17 @@ class ADC(I2C):
         :return: ADC value(0-4095)
         :rtype: int
         """
-        # Write register address
-        self.write([self.chn, 0, 0])
-        # Read values
-        msb, lsb = super().read(2)
+        # select and read as one, another thread (e.g. Robot's servo writer)
+        # writing to the MCU in between would spoil the read
+        with self._lock:
+            # Write register address
+            self.write([self.chn, 0, 0])
+            # Read values
+            msb, lsb = super().read(2)
 
         # Combine MSB and LSB
         value = (msb << 8) + lsb
-        self._debug(f"Read value: {value}")
+        self._debug("Read value: %s", value)
         return value
 
     def read_voltage(self):
@@ -59,5 +62,5 @@ class ADC(I2C):
         value = self.read()
         # Convert to voltage
         voltage = value * 3.3 / 4095
-        self._debug(f"Read voltage: {voltage}")
+        self._debug("Read voltage: %s", voltage)
         return voltage
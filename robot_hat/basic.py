@@ -58,4 +58,6 @@ class _Basic_class(object):
                 f'Debug value must be 0(critical), 1(error), 2(warning), 3(info) or 4(debug), not "{debug}".')
         self.logger.setLevel(self.DEBUG_LEVELS[self._debug_level])
         self.ch.setLevel(self.DEBUG_LEVELS[self._debug_level])
+        # lets hot paths skip building debug messages nobody will see
+        self._debug_enabled = self.logger.isEnabledFor(logging.DEBUG)
         self._debug(f'Set logging level to [{self._debug_level}]')
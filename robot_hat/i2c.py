@@ -2,7 +2,7 @@
 from .basic import _Basic_class
 from smbus import SMBus
 from .utils import run_command
-import multiprocessing
+import threading
 
 
 def _retry_wrapper(func):
@@ -11,7 +11,7 @@ def _retry_wrapper(func):
             try:
                 return func(self, *arg, **kwargs)
             except OSError:
-                self._debug(f"OSError: {func.__name__}")
+                self._debug("OSError: %s", func.__name__)
                 continue
         else:
             return False
@@ -24,7 +24,12 @@ class I2C(_Basic_class):
     """
     RETRY = 5
 
-    # i2c_lock = multiprocessing.Value('i', 0)
+    _smbus_cache = {}
+    """Opened SMBus handles, shared by all objects of the same device"""
+
+    _lock_cache = {}
+    """Locks of each device, held for every transaction. Hold it to keep a
+    sequence of transactions, e.g. a register select and read, together"""
 
     def __init__(self, address=None, bus=1, *args, **kwargs):
         """
@@ -37,64 +42,70 @@ class I2C(_Basic_class):
         """
         super().__init__(*args, **kwargs)
         self._bus = bus
-        self._smbus = SMBus(self._bus)
+        key = (bus, address)
+        if key not in I2C._smbus_cache:
+            I2C._smbus_cache[key] = SMBus(self._bus)
+        self._smbus = I2C._smbus_cache[key]
+        self._lock = I2C._lock_cache.setdefault(key, threading.RLock())
         self.address = address
 
     @_retry_wrapper
     def _write_byte(self, data):   # i2C 写系列函数
-        # with I2C.i2c_lock.get_lock():
-        self._debug(f"_write_byte: [0x{data:02X}]")
-        result = self._smbus.write_byte(self.address, data)
-        return result
+        with self._lock:
+            self._debug("_write_byte: [0x%02X]", data)
+            result = self._smbus.write_byte(self.address, data)
+            return result
 
     @_retry_wrapper
     def _write_byte_data(self, reg, data):
-        # with I2C.i2c_lock.get_lock():
-        self._debug(f"_write_byte_data: [0x{reg:02X}] [0x{data:02X}]")
-        return self._smbus.write_byte_data(self.address, reg, data)
+        with self._lock:
+            self._debug("_write_byte_data: [0x%02X] [0x%02X]", reg, data)
+            return self._smbus.write_byte_data(self.address, reg, data)
 
     @_retry_wrapper
     def _write_word_data(self, reg, data):
-        # with I2C.i2c_lock.get_lock():
-        self._debug(f"_write_word_data: [0x{reg:02X}] [0x{data:04X}]")
-        return self._smbus.write_word_data(self.address, reg, data)
+        with self._lock:
+            self._debug("_write_word_data: [0x%02X] [0x%04X]", reg, data)
+            return self._smbus.write_word_data(self.address, reg, data)
 
     @_retry_wrapper
     def _write_i2c_block_data(self, reg, data):
-        # with I2C.i2c_lock.get_lock():
-        self._debug(
-            f"_write_i2c_block_data: [0x{reg:02X}] {[f'0x{i:02X}' for i in data]}")
-        return self._smbus.write_i2c_block_data(self.address, reg, data)
+        with self._lock:
+            if self._debug_enabled:
+                self._debug(
+                    f"_write_i2c_block_data: [0x{reg:02X}] {[f'0x{i:02X}' for i in data]}")
+            return self._smbus.write_i2c_block_data(self.address, reg, data)
 
     @_retry_wrapper
     def _read_byte(self):
-        # with I2C.i2c_lock.get_lock():
-        result = self._smbus.read_byte(self.address)
-        self._debug(f"_read_byte: [0x{result:02X}]")
-        return result
+        with self._lock:
+            result = self._smbus.read_byte(self.address)
+            self._debug("_read_byte: [0x%02X]", result)
+            return result
 
     @_retry_wrapper
     def _read_byte_data(self, reg):
-        # with I2C.i2c_lock.get_lock():
-        result = self._smbus.read_byte_data(self.address, reg)
-        self._debug(f"_read_byte_data: [0x{reg:02X}] [0x{result:02X}]")
-        return result
+        with self._lock:
+            result = self._smbus.read_byte_data(self.address, reg)
+            self._debug("_read_byte_data: [0x%02X] [0x%02X]", reg, result)
+            return result
 
     @_retry_wrapper
     def _read_word_data(self, reg):
-        # with I2C.i2c_lock.get_lock():
-        result = self._smbus.read_word_data(self.address, reg)
-        result_list = [result & 0xFF, (result >> 8) & 0xFF]
-        self._debug(f"_read_word_data: [0x{reg:02X}] [0x{result:04X}]")
-        return result_list
+        with self._lock:
+            result = self._smbus.read_word_data(self.address, reg)
+            result_list = [result & 0xFF, (result >> 8) & 0xFF]
+            self._debug("_read_word_data: [0x%02X] [0x%04X]", reg, result)
+            return result_list
 
     @_retry_wrapper
     def _read_i2c_block_data(self, reg, num):
-        # with I2C.i2c_lock.get_lock():
-        result = self._smbus.read_i2c_block_data(self.address, reg, num)
-        self._debug(
-            f"_read_i2c_block_data: [0x{reg:02X}] {[f'0x{i:02X}' for i in result]}")
-        return result
+        with self._lock:
+            result = self._smbus.read_i2c_block_data(self.address, reg, num)
+            if self._debug_enabled:
+                self._debug(
+                    f"_read_i2c_block_data: [0x{reg:02X}] {[f'0x{i:02X}' for i in result]}")
+            return result
 
     @_retry_wrapper
     def is_ready(self):
@@ -115,7 +126,7 @@ class I2C(_Basic_class):
         :return: List of I2C addresses of devices found
         :rtype: list
         """
-        cmd = f"i2cdetect -y {self._bus}"
+        cmd = ['i2cdetect', '-y', str(self._bus)]
         # Run the i2cdetect command
         _, output = run_command(cmd)
 
@@ -139,10 +150,10 @@ class I2C(_Basic_class):
         """Write data to the I2C device
 
         :param data: Data to write
-        :type data: int/list/bytearray
-        :raises: ValueError if write is not an int, list or bytearray
+        :type data: int/list/bytes/bytearray
+        :raises: ValueError if write is not an int, list, bytes or bytearray
         """
-        if isinstance(data, bytearray):
+        if isinstance(data, (bytes, bytearray)):
             data_all = list(data)
         elif isinstance(data, int):
             if data == 0:
@@ -156,7 +167,7 @@ class I2C(_Basic_class):
             data_all = data
         else:
             raise ValueError(
-                f"write data must be int, list, or bytearray, not {type(data)}")
+                f"write data must be int, list, bytes or bytearray, not {type(data)}")
 
         # Write data
         if len(data_all) == 1:
@@ -227,6 +238,23 @@ class I2C(_Basic_class):
         result = self._read_i2c_block_data(memaddr, length)
         return result
 
+    def bus_speed(self):
+        """
+        Get the I2C bus clock frequency from the device tree
+
+        :return: bus speed(Hz), None if unknown
+        :rtype: int/None
+        """
+        path = f"/sys/class/i2c-adapter/i2c-{self._bus}/of_node/clock-frequency"
+        try:
+            with open(path, 'rb') as f:
+                data = f.read(4)
+        except OSError:
+            return None
+        if len(data) != 4:
+            return None
+        return int.from_bytes(data, 'big')
+
     def is_avaliable(self):
         """
         Check if the I2C device is avaliable
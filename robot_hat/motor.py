@@ -3,12 +3,11 @@ from .basic import _Basic_class
 from .pwm import PWM
 from .pin import Pin
 from .filedb import fileDB
-import os
+from .utils import get_username, get_user_home
 
 # user and User home directory
-User = os.popen('echo ${SUDO_USER:-$LOGNAME}').readline().strip()
-UserHome = os.popen('getent passwd %s | cut -d: -f 6' %
-                    User).readline().strip()
+User = get_username()
+UserHome = get_user_home()
 config_file = '%s/.config/robot-hat/robot-hat.conf' % UserHome
 
 
@@ -2,15 +2,20 @@
 from .basic import _Basic_class
 import time
 import threading
+import queue
 import pyaudio
 import os
 import struct
 import math
+import logging
 
 # close welcome message of pygame, and the value must be <str> 
 os.environ['PYGAME_HIDE_SUPPORT_PROMPT'] = "1" 
 import pygame
 
+# Music does not set up the _Basic_class logger, report through logging
+_logger = logging.getLogger(__name__)
+
 class Music(_Basic_class):
     """Play music, sound affect and note control"""
 
@@ -65,6 +70,8 @@ class Music(_Basic_class):
         """Initialize music"""
         self.pygame = pygame
         self.pygame.mixer.init()
+        self._sfx_queue = queue.Queue()
+        self._sfx_worker = None
         self.time_signature(4, 4)
         self.tempo(120, 1/4)
         self.key_signature(0)
@@ -168,15 +175,19 @@ class Music(_Basic_class):
         :param filename: sound effect file name
         :type filename: str
         """
+        time_delay = self._sound_start(filename, volume)
+        time.sleep(time_delay)
+
+    def _sound_start(self, filename, volume=None):
+        """Start playing a sound effect, return its length in seconds"""
         sound = self.pygame.mixer.Sound(filename)
         if volume is not None:
             # attention: 
             #   The volume of sound and music is separate, 
             # and the volume of different sound objects is also separate.
             sound.set_volume(round(volume/100.0, 2))
-        time_delay = round(sound.get_length(), 2)
         sound.play()
-        time.sleep(time_delay)
+        return round(sound.get_length(), 2)
 
     def sound_play_threading(self, filename, volume=None):
         """
@@ -187,9 +198,20 @@ class Music(_Basic_class):
         :param volume: volume 0-100, leave empty will not change volume
         :type volume: int
         """
-        obj = threading.Thread(target=self.sound_play, kwargs={
-                               "filename": filename, "volume": volume})
-        obj.start()
+        if self._sfx_worker is None:
+            self._sfx_worker = threading.Thread(
+                target=self._sfx_loop, daemon=True)
+            self._sfx_worker.start()
+        self._sfx_queue.put((filename, volume))
+
+    def _sfx_loop(self):
+        """Start queued sound effects in order, pygame mixes them"""
+        while True:
+            filename, volume = self._sfx_queue.get()
+            try:
+                self._sound_start(filename, volume)
+            except Exception as e:
+                _logger.error(f"sound_play_threading: {e}")
 
     def music_play(self, filename, loops=1, start=0.0, volume=None):
         """
@@ -2,7 +2,10 @@
 import math
 from .i2c import I2C
 
-timer = [{"arr": 1}] * 4
+# arr: period, psc: prescaler, None until programmed
+# pct_lut: pulse width for integer percentages, see period()
+timer = [{"arr": 1, "psc": None, "pct_lut": None}
+         for _ in range(4)]
 
 
 class PWM(I2C):
@@ -20,6 +23,11 @@ class PWM(I2C):
     CLOCK = 72000000.0
     """Clock frequency"""
 
+    BUS_SPEED = 400000
+    """Recommended I2C bus speed(Hz)"""
+
+    _bus_speed_checked = False
+
     def __init__(self, channel, *args, **kwargs):
         """
         Initialize PWM
@@ -28,6 +36,14 @@ class PWM(I2C):
         :type channel: int/str
         """
         super().__init__(self.ADDR, *args, **kwargs)
+        if not PWM._bus_speed_checked:
+            PWM._bus_speed_checked = True
+            speed = self.bus_speed()
+            if speed is not None and speed < self.BUS_SPEED:
+                self._warning(
+                    f"I2C bus speed is {speed} Hz, servo and PWM updates are "
+                    f"faster at {self.BUS_SPEED} Hz: add "
+                    f"dtparam=i2c_arm_baudrate={self.BUS_SPEED} to /boot/config.txt")
         if isinstance(channel, str):
             if channel.startswith("P"):
                 channel = int(channel[1:])
@@ -41,14 +57,33 @@ class PWM(I2C):
 
         self.channel = channel
         self.timer = int(channel/4)
+        # registers and timer state never change for a channel, look them
+        # up once instead of on every write
+        self._reg_chn = self.REG_CHN + self.channel
+        self._reg_psc = self.REG_PSC + self.timer
+        self._reg_arr = self.REG_ARR + self.timer
+        self._timer_ref = timer[self.timer]
         self._pulse_width = 0
-        self._freq = 50
         self.freq(50)
 
     def _i2c_write(self, reg, value):
-        value_h = value >> 8
-        value_l = value & 0xff
-        self.write([reg, value_h, value_l])
+        # register as SMBus command, then high and low byte, in a single
+        # transaction, the same block write used for bulk channel writes
+        self._write_i2c_block_data(reg, [value >> 8, value & 0xff])
+
+    def _timer_is(self, prescaler, arr):
+        """
+        Check if the timer of this channel is programmed with prescaler and arr
+
+        :param prescaler: prescaler
+        :type prescaler: int
+        :param arr: period
+        :type arr: int
+        :return: True if the timer already has these values
+        :rtype: bool
+        """
+        return (self._timer_ref["psc"] == round(prescaler)
+                and self._timer_ref["arr"] == round(arr))
 
     def freq(self, freq=None):
         """
@@ -60,27 +95,31 @@ class PWM(I2C):
         :rtype: float
         """
         if freq == None:
-            return self._freq
-
-        self._freq = int(freq)
-        # [prescaler,arr] list
-        result_ap = []
-        # accuracy list
-        result_acy = []
-        # middle value for equal arr prescaler
-        st = int(math.sqrt(self.CLOCK/self._freq))
-        # get -5 value as start
-        st -= 5
-        # prevent negetive value
-        if st <= 0:
-            st = 1
-        for psc in range(st, st+10):
-            arr = int(self.CLOCK/self._freq/psc)
-            result_ap.append([psc, arr])
-            result_acy.append(abs(self._freq-self.CLOCK/psc/arr))
-        i = result_acy.index(min(result_acy))
-        psc = result_ap[i][0]
-        arr = result_ap[i][1]
+            # computed on demand, prescaler() and period() only keep the
+            # register values
+            return self.CLOCK/self._prescaler/self._timer_ref["arr"]
+
+        freq = int(freq)
+        if self._timer_ref["psc"] is not None:
+            current = self.CLOCK/self._timer_ref["psc"]/self._timer_ref["arr"]
+            if round(current) == freq:
+                # timer already runs at this frequency, set up by another
+                # channel sharing it, no need to program it again
+                self._prescaler = self._timer_ref["psc"]
+                return
+        ticks = self.CLOCK/freq
+        # middle value for equal arr prescaler, -5 as start
+        st = max(1, int(math.sqrt(ticks)) - 5)
+        psc, arr, accuracy = None, None, None
+        for _psc in range(st, st+10):
+            # arr rounded down and up, whichever is closer
+            _floor = int(ticks/_psc)
+            for _arr in (_floor, _floor + 1):
+                if _arr <= 0:
+                    continue
+                _accuracy = abs(freq-self.CLOCK/_psc/_arr)
+                if accuracy is None or _accuracy < accuracy:
+                    psc, arr, accuracy = _psc, _arr, _accuracy
         self._debug(f"prescaler: {psc}, period: {arr}")
         self.prescaler(psc)
         self.period(arr)
@@ -98,10 +137,9 @@ class PWM(I2C):
             return self._prescaler
 
         self._prescaler = round(prescaler)
-        self._freq = self.CLOCK/self._prescaler/timer[self.timer]["arr"]
-        reg = self.REG_PSC + self.timer
+        self._timer_ref["psc"] = self._prescaler
         self._debug(f"Set prescaler to: {self._prescaler}")
-        self._i2c_write(reg, self._prescaler-1)
+        self._i2c_write(self._reg_psc, self._prescaler-1)
 
     def period(self, arr=None):
         """
@@ -112,15 +150,14 @@ class PWM(I2C):
         :return: period
         :rtype: int
         """
-        global timer
         if arr == None:
-            return timer[self.timer]["arr"]
+            return self._timer_ref["arr"]
 
-        timer[self.timer]["arr"] = round(arr)
-        self._freq = self.CLOCK/self._prescaler/timer[self.timer]["arr"]
-        reg = self.REG_ARR + self.timer
-        self._debug(f"Set arr to: {timer[self.timer]['arr']}")
-        self._i2c_write(reg, timer[self.timer]["arr"])
+        self._timer_ref["arr"] = round(arr)
+        self._timer_ref["pct_lut"] = [pct * self._timer_ref["arr"] // 100
+                                      for pct in range(101)]
+        self._debug(f"Set arr to: {self._timer_ref['arr']}")
+        self._i2c_write(self._reg_arr, self._timer_ref["arr"])
 
     def pulse_width(self, pulse_width=None):
         """
@@ -135,8 +172,7 @@ class PWM(I2C):
             return self._pulse_width
 
         self._pulse_width = int(pulse_width)
-        reg = self.REG_CHN + self.channel
-        self._i2c_write(reg, self._pulse_width)
+        self._i2c_write(self._reg_chn, self._pulse_width)
 
     def pulse_width_percent(self, pulse_width_percent=None):
         """
@@ -147,42 +183,16 @@ class PWM(I2C):
         :return: pulse width percentage
         :rtype: float
         """
-        global timer
         if pulse_width_percent == None:
             return self._pulse_width_percent
 
         self._pulse_width_percent = pulse_width_percent
-        temp = self._pulse_width_percent / 100.0
-        # print(temp)
-        pulse_width = temp * timer[self.timer]["arr"]
+        # the table for integer percentages is updated with the period,
+        # both truncate like pulse_width(), multiplying before dividing
+        # keeps 100% at arr
+        if isinstance(pulse_width_percent, int) and 0 <= pulse_width_percent <= 100:
+            pulse_width = self._timer_ref["pct_lut"][pulse_width_percent]
+        else:
+            pulse_width = int(
+                pulse_width_percent * self._timer_ref["arr"] / 100)
         self.pulse_width(pulse_width)
-
-
-def test():
-    import time
-    p = PWM(0)
-    # p.debug = 'debug'
-    p.period(1000)
-    p.prescaler(10)
-    # p.pulse_width(2048)
-    while True:
-        for i in range(0, 4095, 10):
-            p.pulse_width(i)
-            print(i)
-            time.sleep(1/4095)
-        time.sleep(1)
-        for i in range(4095, 0, -10):
-            p.pulse_width(i)
-            print(i)
-            time.sleep(1/4095)
-        time.sleep(1)
-
-
-def test2():
-    p = PWM("P0")
-    while True:
-        p.pulse_width_percent(50)
-
-
-if __name__ == '__main__':
-    test2()
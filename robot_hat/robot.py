@@ -4,12 +4,15 @@ from .pwm import PWM
 from .servo import Servo
 import time
 from .filedb import fileDB
-import os
+from .utils import get_username, get_user_home
+import json
+import ast
+import queue
+import threading
 
 # user and User home directory
-User = os.popen('echo ${SUDO_USER:-$LOGNAME}').readline().strip()
-UserHome = os.popen('getent passwd %s | cut -d: -f 6' %
-                    User).readline().strip()
+User = get_username()
+UserHome = get_user_home()
 config_file = '%s/.config/robot-hat/robot-hat.conf' % UserHome
 
 
@@ -36,6 +39,30 @@ class Robot(_Basic_class):
     # max_dps = 500
     """Servo max Degree Per Second"""
 
+    step_time = 10
+    """Time(ms) of each servo_move step"""
+
+    spin_time = 0.0005
+    """Time(s) busy waited before each servo_move step instead of sleeping"""
+
+    SPEED_TOTAL_TIME = [-9.9 * speed + 1000 for speed in range(101)]
+    """Total servo move time(ms) of each integer speed(0-100)"""
+
+    servo_resolution = 180 / ((Servo.MAX_PW - Servo.MIN_PW) / 20000 * Servo.PERIOD)
+    """Servo angle(degree) of one pulse width step"""
+
+    init_batch = 2
+    """Number of servos started together on initialization, 0.15s apart"""
+
+    plan_cache_size = 64
+    """Number of servo_move step plans kept for repeated moves"""
+
+    threaded_write = False
+    """Write servo_move steps from a background thread, so the I2C transfer
+    overlaps the next step's computing and waiting. ADC reads hold the
+    MCU's I2C lock, so a step is never written between their channel
+    select and read"""
+
     def __init__(self, pin_list, db=config_file, name=None, init_angles=None, init_order=None, **kwargs):
         """
         Initialize the robot class
@@ -48,7 +75,7 @@ class Robot(_Basic_class):
         :type name: str
         :param init_angles: list of initial angles
         :type init_angles: list
-        :param init_order: list of initialization order(Servos will init one by one in case of sudden huge current, pulling down the power supply voltage. default order is the pin list. in some cases, you need different order, use this parameter to set it.)
+        :param init_order: list of initialization order(Servos will init init_batch at a time in case of sudden huge current, pulling down the power supply voltage. default order is the pin list. in some cases, you need different order, use this parameter to set it.)
         :type init_order: list
         :type init_angles: list
         """
@@ -65,15 +92,32 @@ class Robot(_Basic_class):
         # offset
         self.db = fileDB(db=db, mode='774', owner=User)
         temp = self.db.get(self.offset_value_name,
-                           default_value=str(self.new_list(0)))
-        temp = [float(i.strip()) for i in temp.strip("[]").split(",")]
-        self.offset = temp
+                           default_value=json.dumps(self.new_list(0)))
+        try:
+            try:
+                offset = json.loads(temp)
+            except ValueError:
+                # older config files may hold a Python literal
+                offset = ast.literal_eval(temp)
+            # fit the stored list to the servo count, it may come from a
+            # robot with another pin list
+            offset = [float(i) for i in list(offset)[:self.pin_num]]
+        except (TypeError, ValueError, SyntaxError):
+            self._warning(f'Invalid {self.offset_value_name}: {temp}, reset to 0')
+            offset = []
+        offset += [0.0] * (self.pin_num - len(offset))
+        self.offset = offset
 
         # parameter init
         self.servo_positions = self.new_list(0)
         self.origin_positions = self.new_list(0)
         self.calibrate_position = self.new_list(0)
         self.direction = self.new_list(1)
+        self._plan_cache = {}
+        # one step in flight at most, a slow bus holds back the next step
+        # instead of piling up stale ones
+        self._write_queue = queue.Queue(maxsize=1)
+        self._write_worker = None
 
         # servo init
         if None == init_angles:
@@ -87,8 +131,17 @@ class Robot(_Basic_class):
         for i, pin in enumerate(pin_list):
             self.servo_list.append(Servo(pin))
             self.servo_positions[i] = init_angles[i]
-        for i in init_order:
-            self.servo_list[i].angle(self.offset[i]+self.servo_positions[i])
+        # constants of each servo's angle to pulse width conversion:
+        # value = (angle + 90) * scale + start
+        self._servo_consts = [(servo, servo._angle_scale, servo._angle_start)
+                              for servo in self.servo_list]
+        init_order = list(init_order)
+        init_angles = [off + pos for off, pos in
+                       zip(self.offset, self.servo_positions)]
+        for n in range(0, len(init_order), self.init_batch):
+            # one transaction per servo, the MCU reads fixed 3 byte frames
+            for i in init_order[n:n + self.init_batch]:
+                self.servo_list[i].angle(init_angles[i])
             time.sleep(0.15)
 
         self.last_move_time = time.time()
@@ -112,8 +165,17 @@ class Robot(_Basic_class):
         :param angle_list: list of servo angles
         :type angle_list: list
         """
-        for i in range(self.pin_num):
-            self.servo_list[i].angle(angle_list[i])
+        # angle to pulse width and register bytes in one pass, same result
+        # as Servo.angle(), which is also one transaction per servo
+        for i, (servo, scale, start) in enumerate(self._servo_consts):
+            angle = angle_list[i]
+            if angle < -90:
+                angle = -90
+            elif angle > 90:
+                angle = 90
+            value = int((angle + 90) * scale + start)
+            servo._pulse_width = value
+            servo._write_i2c_block_data(servo._reg_chn, [value >> 8, value & 0xff])
 
     def servo_write_all(self, angles):
         """
@@ -122,10 +184,8 @@ class Robot(_Basic_class):
         :param angles: list of servo angles
         :type angles: list
         """
-        rel_angles = []  # ralative angle to home
-        for i in range(self.pin_num):
-            rel_angles.append(
-                self.direction[i] * (self.origin_positions[i] + angles[i] + self.offset[i]))
+        rel_angles = [d * (o + a + off) for d, o, a, off in  # ralative angle to home
+                      zip(self.direction, self.origin_positions, angles, self.offset)]
         self.servo_write_raw(rel_angles)
 
     def servo_move(self, targets, speed=50, bpm=None):
@@ -145,11 +205,9 @@ class Robot(_Basic_class):
         '''
         speed = max(0, speed)
         speed = min(100, speed)
-        step_time = 10  # ms 
-        delta = []
-        absdelta = []
-        max_step = 0
-        steps = []
+        step_time = self.step_time  # ms
+        if len(targets) < self.pin_num:
+            raise ValueError('target numbers do not match pin numbers')
         # print(f"targets: {targets}")
         # print(f"current:{self.servo_positions}")
         # st = time.time()
@@ -157,20 +215,106 @@ class Robot(_Basic_class):
         #     print(f"move_interval: {time.time() - self.last_move_time}")
         #     self.last_move_time = time.time()
 
-        for i in range(self.pin_num):
-            value = targets[i] - self.servo_positions[i]
-            delta.append(value)
-            absdelta.append(abs(value))
-
-        # Calculate max delta angle
-        max_delta = int(max(absdelta))
-        if max_delta == 0:
+        # preset actions repeat the same moves from the same positions,
+        # reuse their step plan
+        plan_key = (tuple(self.servo_positions), tuple(targets),
+                    speed, bpm, self.max_dps)
+        plan = self._plan_cache.get(plan_key)
+        if plan is None:
+            plan = self._plan_move(targets, speed, bpm)
+            if len(self._plan_cache) >= self.plan_cache_size:
+                self._plan_cache.clear()
+            self._plan_cache[plan_key] = plan
+        max_step, steps = plan
+
+        if max_step == 0:
+            # below one pulse width step, stepping would only repeat the
+            # same I2C writes, go to the target at once
+            if any(steps):
+                self.servo_positions[:] = targets[:len(self.servo_positions)]
+                self.servo_write_all(self.servo_positions)
             time.sleep(step_time/1000)
             return
 
+        # print(f"usage1: {time.time() - st}")
+        # st = time.time()
+
+        # relative angle = direction * (origin + position + offset),
+        # direction, origin and offset do not change during the move
+        direction = self.direction
+        base = [d * (o + off) for d, o, off in
+                zip(direction, self.origin_positions, self.offset)]
+        # no servo reversed, the usual case: skip multiplying by 1
+        forward = all(d == 1 for d in direction)
+        positions = self.servo_positions
+        # local names, the loop below runs every step_time
+        step = step_time/1000
+        spin_time = self.spin_time
+        if self.threaded_write:
+            servo_write_raw = self._queue_write
+        else:
+            servo_write_raw = self.servo_write_raw
+        clock = time.perf_counter
+        sleep = time.sleep
+
+        # print(f"max_delta: {max_delta}, max_step: {max_step}")
+        # wait for absolute deadlines, so late wake-ups do not add up: sleep
+        # to just before the deadline, then busy wait for the rest
+        deadline = clock()
+        for _ in range(max_step):
+            positions[:] = [p + s for p, s in zip(positions, steps)]
+            if forward:
+                servo_write_raw([b + p for b, p in zip(base, positions)])
+            else:
+                servo_write_raw(
+                    [b + d * p for b, d, p in zip(base, direction, positions)])
+
+            deadline += step
+            now = clock()
+            # overran a whole step, skip to the next period instead of
+            # rushing the following steps
+            while deadline < now:
+                deadline += step
+            delay = deadline - now - spin_time
+            if delay > 0:
+                sleep(delay)
+            while clock() < deadline:
+                pass
+        if self.threaded_write:
+            # later writes must not overtake the queued steps
+            self._write_queue.join()
+        # land exactly on the targets, the summed steps drift by float
+        # rounding and would not match the next move's plan key
+        positions[:] = targets[:len(positions)]
+        # print(f"usage2: {time.time() - st}, max_steps: {max_step}")
+
+    def _plan_move(self, targets, speed, bpm):
+        """
+        Plan the steps of a servo_move
+
+        :param targets: list of servo angles
+        :type targets: list
+        :param speed: speed of servo move, 0-100
+        :type speed: int or float
+        :param bpm: beats per minute
+        :type bpm: int or float
+        :return: (number of steps, angle of each servo per step), 0 steps
+            if no servo moves more than servo_resolution
+        :rtype: tuple
+        """
+        delta = [t - p for t, p in zip(targets, self.servo_positions)]
+
+        # Calculate max delta angle
+        max_delta = max(map(abs, delta))
+        if max_delta <= self.servo_resolution:
+            return 0, delta
+        max_delta = int(max_delta)
+
         # Calculate total servo move time
         if bpm: # bpm: beats per minute
             total_time = 60 / bpm * 1000 # time taken per beat, unit: ms
+        elif isinstance(speed, int):
+            total_time = self.SPEED_TOTAL_TIME[speed]
         else:
             total_time = -9.9 * speed + 1000 # time spent in one step, unit: ms
         # print(f"Total time: {total_time} ms")
@@ -187,35 +331,35 @@ class Robot(_Basic_class):
             total_time = max_delta / self.max_dps * 1000
             # print(f"New Total time: {total_time} ms")
         # calculate max step
-        max_step = int(total_time / step_time)
+        max_step = int(total_time / self.step_time)
 
         # Calculate all step-angles for each servo
-        for i in range(self.pin_num):
-            step = float(delta[i])/max_step
-            steps.append(step)
+        steps = [float(d)/max_step for d in delta]
+        return max_step, steps
 
-        # print(f"usage1: {time.time() - st}")
-        # st = time.time()
+    def _queue_write(self, angle_list):
+        """
+        Queue raw servo angles for the writer thread, start it if needed
 
-        # print(f"max_delta: {max_delta}, max_step: {max_step}")
-        for _ in range(max_step):
-            start_timer = time.time()
-            delay = step_time/1000
-
-            for j in range(self.pin_num):
-                self.servo_positions[j] += steps[j]
-            self.servo_write_all(self.servo_positions)
-
-            servo_move_time = time.time() - start_timer
-            # print(f"Servo move: {servo_move_time}")
-            delay = delay - servo_move_time
-            delay = max(0, delay)
-            time.sleep(delay)
-            # _dealy_start = time.time()
-            # if delay > 0:
-            #     while (time.time() - _dealy_start < delay):
-            #         pass
-        # print(f"usage2: {time.time() - st}, max_steps: {max_step}")
+        :param angle_list: list of servo angles
+        :type angle_list: list
+        """
+        if self._write_worker is None:
+            self._write_worker = threading.Thread(
+                target=self._write_loop, daemon=True)
+            self._write_worker.start()
+        self._write_queue.put(angle_list)
+
+    def _write_loop(self):
+        """Write queued raw servo angles in order"""
+        while True:
+            angle_list = self._write_queue.get()
+            try:
+                self.servo_write_raw(angle_list)
+            except Exception as e:
+                self._error(f"servo write: {e}")
+            finally:
+                self._write_queue.task_done()
 
     def do_action(self, motion_name, step=1, speed=50):
         """
@@ -239,11 +383,26 @@ class Robot(_Basic_class):
         :param offset_list: list of servo angles
         :type offset_list: list
         """
-        offset_list = [min(max(offset, -20), 20) for offset in offset_list]
-        temp = str(offset_list)
+        if len(offset_list) != self.pin_num:
+            raise ValueError('offset numbers do not match pin numbers')
+        offset_list = [min(max(float(offset), -20.0), 20.0)
+                       for offset in offset_list]
+        temp = json.dumps(offset_list)
         self.db.set(self.offset_value_name, temp)
         self.offset = offset_list
 
+    def set_direction(self, direction_list):
+        """
+        Set direction of servos
+
+        :param direction_list: list of servo directions, 1 or -1(reversed)
+        :type direction_list: list
+        """
+        if len(direction_list) != self.pin_num:
+            raise ValueError('direction numbers do not match pin numbers')
+        self.direction = [-1 if direction < 0 else 1
+                          for direction in direction_list]
+
     def calibration(self):
         """Move all servos to home position"""
         self.servo_positions = self.calibrate_position
@@ -1,6 +1,5 @@
 #!/usr/bin/env python3
 from .pwm import PWM
-from .utils import mapping
 
 
 class Servo(PWM):
@@ -18,9 +17,19 @@ class Servo(PWM):
         :type channel: int/str
         """
         super().__init__(channel, *args, **kwargs)
-        self.period(self.PERIOD)
+        # angle to pulse width is linear: value = (angle + 90) * scale + start
+        self._angle_scale = (self.MAX_PW - self.MIN_PW) / 180 / 20000 * self.PERIOD
+        self._angle_start = self.MIN_PW / 20000 * self.PERIOD
+        # exact values of whole degrees, the most common angles
+        self._angle_lut = [int((angle + 90) * self._angle_scale + self._angle_start)
+                           for angle in range(-90, 91)]
         prescaler = self.CLOCK / self.FREQ / self.PERIOD
-        self.prescaler(prescaler)
+        if self._timer_is(prescaler, self.PERIOD):
+            # timer already set up by another servo sharing it
+            self._prescaler = round(prescaler)
+        else:
+            self.period(self.PERIOD)
+            self.prescaler(prescaler)
 
     def angle(self, angle):
         """
@@ -32,14 +41,26 @@ class Servo(PWM):
         if not (isinstance(angle, int) or isinstance(angle, float)):
             raise ValueError(
                 "Angle value should be int or float value, not %s" % type(angle))
+        value = self.encode(angle)
+        self._debug("Set angle to: %s, pulse width value: %s", angle, value)
+        self.pulse_width(value)
+
+    def encode(self, angle):
+        """
+        Convert angle to pulse width value, without writing it
+
+        :param angle: angle(-90~90)
+        :type angle: float
+        :return: pulse width value(0-PERIOD)
+        :rtype: int
+        """
         if angle < -90:
             angle = -90
-        if angle > 90:
+        elif angle > 90:
             angle = 90
-        self._debug(f"Set angle to: {angle}")
-        pulse_width_time = mapping(angle, -90, 90, self.MIN_PW, self.MAX_PW)
-        self._debug(f"Pulse width: {pulse_width_time}")
-        self.pulse_width_time(pulse_width_time)
+        if type(angle) is int:
+            return self._angle_lut[angle + 90]
+        return int((angle + 90) * self._angle_scale + self._angle_start)
 
     def pulse_width_time(self, pulse_width_time):
         """
@@ -54,7 +75,7 @@ class Servo(PWM):
             pulse_width_time = self.MIN_PW
 
         pwr = pulse_width_time / 20000
-        self._debug(f"pulse width rate: {pwr}")
+        self._debug("pulse width rate: %s", pwr)
         value = int(pwr * self.PERIOD)
-        self._debug(f"pulse width value: {value}")
+        self._debug("pulse width value: %s", value)
         self.pulse_width(value)
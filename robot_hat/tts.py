@@ -1,8 +1,36 @@
 #!/usr/bin/env python3
 from .basic import _Basic_class
-from .utils import is_installed, run_command
 from .music import Music
-from distutils.spawn import find_executable
+from .utils import _which
+import atexit
+import hashlib
+import os
+import shutil
+import subprocess
+import tempfile
+
+_stdout_wav = None
+
+
+def _get_stdout_wav():
+    """
+    Get a *.wav path linked to the writer's stdout
+
+    pico2wave only writes to *.wav files, the link lets it write the wave
+    into a pipe instead. The link lives in a private temporary directory,
+    created once and removed at exit.
+
+    :return: path of the link
+    :rtype: str
+    """
+    global _stdout_wav
+    if _stdout_wav is None:
+        tmp_dir = tempfile.mkdtemp(prefix='robot-hat-tts-')
+        atexit.register(shutil.rmtree, tmp_dir, True)
+        path = os.path.join(tmp_dir, 'stdout.wav')
+        os.symlink('/dev/stdout', path)
+        _stdout_wav = path
+    return _stdout_wav
 
 
 class TTS(_Basic_class):
@@ -23,6 +51,13 @@ class TTS(_Basic_class):
     PICO2WAVE = 'pico2wave'
     """pico2wave TTS engine"""
 
+    CACHE_DIR = os.path.join(
+        os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache'),
+        'robot-hat', 'tts')
+    """Directory of cached pico2wave waves"""
+    CACHE_SIZE = 64
+    """Number of cached waves to keep, least recently said are removed first"""
+
     def __init__(self, engine=PICO2WAVE, lang=None, *args, **kwargs):
         """
         Initialize TTS class.
@@ -32,15 +67,20 @@ class TTS(_Basic_class):
         """
         super().__init__()
         self.engine = engine
+        self._engine_path = _which(engine)
+        self._dispatch = {
+            self.ESPEAK: self.espeak,
+            self.PICO2WAVE: self.pico2wave,
+        }
         if (engine == self.ESPEAK):
-            if not is_installed("espeak"):
+            if self._engine_path is None:
                 raise Exception("TTS engine: espeak is not installed.")
             self._amp = 100
             self._speed = 175
             self._gap = 5
             self._pitch = 50
         elif (engine == self.PICO2WAVE):
-            if not is_installed("pico2wave"):
+            if self._engine_path is None:
                 raise Exception("TTS engine: pico2wave is not installed.")
             if lang == None:
                 self._lang = "en-US"
@@ -48,48 +88,171 @@ class TTS(_Basic_class):
                 self._lang = lang
 
     def _check_executable(self, executable):
-        executable_path = find_executable(executable)
-        found = executable_path is not None
-        return found
+        return _which(executable) is not None
 
-    def say(self, words):
+    def say(self, words, wait=True):
         """
         Say words.
 
         :param words: words to say.
         :type words: str
+        :param wait: wait until the words are said, or return at once and
+            leave them playing in the background
+        :type wait: bool
+        :return: handle of the playback to pass to wait(), None if waited
+        :rtype: tuple
+        """
+        return self._dispatch[self.engine](words, wait)
+
+    def wait(self, handle):
+        """
+        Wait until a playback returned by say(wait=False) ends.
+
+        :param handle: handle returned by say()
+        :type handle: tuple
+        :return: aplay exit code, None if nothing was played
+        :rtype: int
         """
-        eval(f"self.{self.engine}('{words}')")
+        returncode = None
+        for process in handle:
+            returncode = process.wait()
+        return returncode
 
-    def espeak(self, words):
+    def espeak(self, words, wait=True):
         """
         Say words with espeak.
 
         :param words: words to say.
         :type words: str
+        :param wait: wait until the words are said
+        :type wait: bool
+        :return: handle of the playback, None if waited
+        :rtype: tuple
         """
         self._debug(f'espeak: [{words}]')
         if not self._check_executable('espeak'):
             self._debug('espeak is busy. Pass')
 
-        cmd = f'espeak -a{self._amp} -s{self._speed} -g{self._gap} -p{self._pitch} "{self.words}" --stdout | aplay 2>/dev/null & '
-        run_command(cmd)
-        self._debug(f'command: {cmd}')
+        cmd = [self._engine_path, f'-a{self._amp}', f'-s{self._speed}',
+               f'-g{self._gap}', f'-p{self._pitch}', words, '--stdout']
+        return self._pipe_to_aplay(cmd, wait)
 
-    def pico2wave(self, words):
+    def pico2wave(self, words, wait=True):
         """
         Say words with pico2wave.
 
         :param words: words to say.
         :type words: str
+        :param wait: wait until the words are said
+        :type wait: bool
+        :return: handle of the playback, None if waited
+        :rtype: tuple
         """
         self._debug(f'pico2wave: [{words}]')
         if not self._check_executable('pico2wave'):
             self._debug('pico2wave is busy. Pass')
 
-        cmd = f'pico2wave -l {self._lang} -w /tmp/tts.wav "{words}" && aplay /tmp/tts.wav 2>/dev/null & '
-        run_command(cmd)
+        try:
+            path = self._synthesize(words)
+        except OSError as e:
+            # cache not writable, stream the wave instead
+            self._debug(f'tts cache unavailable: {e}')
+        else:
+            handle = ()
+            if path is not None:
+                cmd = ['aplay', '-q', path]
+                self._debug(f'command: {cmd}')
+                handle = (subprocess.Popen(cmd, stdout=subprocess.DEVNULL,
+                                           stderr=subprocess.DEVNULL),)
+            return self._finish(handle, wait)
+
+        # stream the wave from pico2wave straight into aplay, no temporary
+        # file to write, play and remove
+        cmd = [self._engine_path, '-l', self._lang, '-w', _get_stdout_wav(), words]
+        return self._pipe_to_aplay(cmd, wait)
+
+    def _pipe_to_aplay(self, cmd, wait):
+        """
+        Run a TTS command and play the wave it writes to stdout with aplay
+
+        :param cmd: command writing a wave to stdout
+        :type cmd: list
+        :param wait: wait until the wave is played
+        :type wait: bool
+        :return: handle of the playback, None if waited
+        :rtype: tuple
+        """
+        synth = subprocess.Popen(cmd, stdout=subprocess.PIPE)
+        play = subprocess.Popen(['aplay', '-q'], stdin=synth.stdout,
+                                stdout=subprocess.DEVNULL,
+                                stderr=subprocess.DEVNULL)
+        # aplay holds the read end now, so synth sees SIGPIPE if aplay dies
+        synth.stdout.close()
+        self._debug(f'command: {cmd} | aplay')
+        # aplay ends last, wait() returns its exit code
+        return self._finish((synth, play), wait)
+
+    def _finish(self, handle, wait):
+        """
+        Wait for a playback or hand it to the caller
+
+        :param handle: processes of the playback
+        :type handle: tuple
+        :param wait: wait until the playback ends
+        :type wait: bool
+        :return: handle, None if waited
+        :rtype: tuple
+        """
+        if wait:
+            self.wait(handle)
+            return None
+        return handle
+
+    def _synthesize(self, words):
+        """
+        Get the cached pico2wave wave of words, synthesize it on a miss
+
+        :param words: words to say.
+        :type words: str
+        :return: path of the wave, None if pico2wave failed
+        :rtype: str
+        :raises OSError: if the cache directory is not usable
+        """
+        key = hashlib.blake2b(
+            f'{self._lang}\0{words}'.encode()).hexdigest()
+        path = os.path.join(self.CACHE_DIR, key + '.wav')
+        if os.path.exists(path):
+            # mtime is the recency used for eviction
+            os.utime(path)
+            return path
+
+        os.makedirs(self.CACHE_DIR, exist_ok=True)
+        # synthesize next to the cache entry and rename it in place, so an
+        # interrupted pico2wave never leaves a truncated wave behind
+        part = os.path.join(self.CACHE_DIR, f'.{key}.{os.getpid()}.wav')
+        cmd = [self._engine_path, '-l', self._lang, '-w', part, words]
         self._debug(f'command: {cmd}')
+        if subprocess.run(cmd).returncode != 0 or not os.path.exists(part):
+            if os.path.exists(part):
+                os.remove(part)
+            return None
+        os.replace(part, path)
+        self._evict_cache()
+        return path
+
+    def _evict_cache(self):
+        """Remove the least recently said waves beyond CACHE_SIZE"""
+        with os.scandir(self.CACHE_DIR) as it:
+            entries = [e for e in it
+                       if e.name.endswith('.wav') and not e.name.startswith('.')]
+        if len(entries) <= self.CACHE_SIZE:
+            return
+        entries.sort(key=lambda e: e.stat().st_mtime, reverse=True)
+        for entry in entries[self.CACHE_SIZE:]:
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
 
     def lang(self, *value):
         """
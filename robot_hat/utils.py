@@ -2,8 +2,44 @@
 import time
 import os
 import re
+import errno
+import fcntl
+import math
+import getpass
+import pwd
+import socket
+import struct
+import shutil
+import subprocess
+import threading
+from functools import lru_cache
 from .pin import Pin
 
+try:
+    import alsaaudio
+except ImportError:
+    alsaaudio = None
+
+SIOCGIFADDR = 0x8915
+"""ioctl request to get the IPv4 address of a network interface"""
+IP_CACHE_TIME = 5
+"""Time(s) get_ip() reuses the address found for an interface"""
+_ip_cache = {}
+_INET_RE = re.compile(rb'(?<=inet )([\d.]+)(?=/)')
+_adc_obj = None
+_adc_lock = threading.Lock()
+BATTERY_SMOOTHING = 0.3
+"""Weight of a new battery reading in the moving average"""
+BATTERY_SMOOTHING_TIME = 2
+"""Time(s) after which an old battery average is dropped, not smoothed"""
+_battery_time = None
+_battery_voltage = None
+
+MCU_RESET_PULSE = 0.0001
+"""Time(s) the mcu reset pin is held low by reset_mcu()"""
+
+_mixer = None
+
 
 def set_volume(value):
     """
@@ -13,25 +49,119 @@ def set_volume(value):
     :type value: int
     """
     value = min(100, max(0, value))
-    cmd = "sudo amixer -M sset 'PCM' %d%%" % value
-    os.system(cmd)
+    # set the mixer in process with pyalsaaudio if it is installed, amixer
+    # otherwise or if the mixer can not be opened
+    if alsaaudio is not None and hasattr(alsaaudio, 'VOLUME_UNITS_DB'):
+        try:
+            _set_mixer_volume(value)
+            return
+        except alsaaudio.ALSAAudioError:
+            pass
+    cmd = ['amixer', '-M', 'sset', 'PCM', '%d%%' % value]
+    if os.geteuid() != 0:
+        cmd.insert(0, 'sudo')
+    try:
+        subprocess.run(cmd)
+    except OSError:
+        # no amixer (or sudo), leave the volume as it is
+        pass
+
+
+def _set_mixer_volume(value):
+    """
+    Set PCM volume with pyalsaaudio, on the same curve as "amixer -M"
+
+    :param value: volume(0~100)
+    :type value: int
+    """
+    global _mixer
+    if _mixer is None:
+        _mixer = alsaaudio.Mixer('PCM')
+    try:
+        # 1/100 dB, like ALSA
+        min_db, max_db = _mixer.getrange(units=alsaaudio.VOLUME_UNITS_DB)
+    except alsaaudio.ALSAAudioError:
+        # no dB information, amixer falls back to the raw range too
+        _mixer.setvolume(value)
+        return
+    volume = value / 100
+    if max_db - min_db <= 2400:
+        # small ranges are mapped linearly in dB
+        db = volume * (max_db - min_db) + min_db
+    else:
+        min_norm = 10 ** ((min_db - max_db) / 6000)
+        volume = volume * (1 - min_norm) + min_norm
+        if volume <= 0:
+            db = min_db
+        else:
+            db = 6000 * math.log10(volume) + max_db
+    _mixer.setvolume(round(db), units=alsaaudio.VOLUME_UNITS_DB)
+
+
+@lru_cache(maxsize=1)
+def get_username():
+    """
+    Get the name of the user running the program, the one behind sudo if
+    run with sudo
+
+    :return: user name
+    :rtype: str
+    """
+    # same order as ${SUDO_USER:-$LOGNAME}, getpass covers the rest
+    return (os.environ.get('SUDO_USER') or os.environ.get('LOGNAME')
+            or getpass.getuser())
+
+
+@lru_cache(maxsize=1)
+def get_user_home():
+    """
+    Get the home directory of the user from get_username()
+
+    :return: home directory
+    :rtype: str
+    """
+    try:
+        return pwd.getpwnam(get_username()).pw_dir
+    except KeyError:
+        # user missing from the passwd database, e.g. in a container
+        return os.path.expanduser('~')
 
 
 def run_command(cmd):
     """
     Run command and return status and output
 
-    :param cmd: command to run
-    :type cmd: str
+    A string is run by /bin/sh, a list of arguments is run directly
+    without a shell.
+
+    :param cmd: command to run, string or list of arguments
+    :type cmd: str/list
     :return: status, output
     :rtype: tuple
     """
-    import subprocess
-    p = subprocess.Popen(
-        cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-    result = p.stdout.read().decode('utf-8')
-    status = p.poll()
-    return status, result
+    shell = isinstance(cmd, str)
+    try:
+        # run() waits for the exit status and closes the pipe, poll() right
+        # after reading could return None before the child was reaped
+        p = subprocess.run(
+            cmd, shell=shell, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    except FileNotFoundError as e:
+        # same status as the shell for a missing program
+        return 127, str(e)
+    return p.returncode, p.stdout.decode('utf-8')
+
+
+@lru_cache(maxsize=None)
+def _which(executable):
+    """
+    Find the path of an executable, cached as PATH scans are slow
+
+    :param executable: executable name
+    :type executable: str
+    :return: path of the executable, None if not found
+    :rtype: str
+    """
+    return shutil.which(executable)
 
 
 def is_installed(cmd):
@@ -43,11 +173,7 @@ def is_installed(cmd):
     :return: True if installed
     :rtype: bool
     """
-    status, _ = run_command(f"which {cmd}")
-    if status in [0, ]:
-        return True
-    else:
-        return False
+    return _which(cmd) is not None
 
 
 def mapping(x, in_min, in_max, out_min, out_max):
@@ -70,6 +196,70 @@ def mapping(x, in_min, in_max, out_min, out_max):
     return (x - in_min) * (out_max - out_min) / (in_max - in_min) + out_min
 
 
+@lru_cache(maxsize=32)
+def make_mapper(in_min, in_max, out_min, out_max):
+    """
+    Make a function mapping values from one range to another range
+
+    Same as mapping() with fixed ranges, up to float rounding. The scale is
+    computed once, so each call is one multiply and one add. Mappers are
+    cached, making one for the same ranges again returns the same function.
+
+    :param in_min: input minimum
+    :type in_min: float/int
+    :param in_max: input maximum
+    :type in_max: float/int
+    :param out_min: output minimum
+    :type out_min: float/int
+    :param out_max: output maximum
+    :type out_max: float/int
+    :return: function mapping a value
+    :rtype: function
+    """
+    scale = (out_max - out_min) / (in_max - in_min)
+    offset = out_min - in_min * scale
+
+    def mapper(x):
+        return x * scale + offset
+    return mapper
+
+
+def mapping_array(values, in_min, in_max, out_min, out_max, out=None):
+    """
+    Map all values of a sequence from one range to another range
+
+    NumPy arrays (or anything with a dtype) are mapped with whole array
+    operations, in place in out if given, so there is no Python loop.
+    Other sequences are mapped into a new list.
+
+    :param values: values to map
+    :type values: list/numpy.ndarray
+    :param in_min: input minimum
+    :type in_min: float/int
+    :param in_max: input maximum
+    :type in_max: float/int
+    :param out_min: output minimum
+    :type out_min: float/int
+    :param out_max: output maximum
+    :type out_max: float/int
+    :param out: float array to write the result to, same shape as values
+    :type out: numpy.ndarray
+    :return: mapped values
+    :rtype: list/numpy.ndarray
+    """
+    scale = (out_max - out_min) / (in_max - in_min)
+    offset = out_min - in_min * scale
+    if hasattr(values, 'dtype'):
+        if out is None:
+            out = values * scale
+        else:
+            out[...] = values
+            out *= scale
+        out += offset
+        return out
+    return [x * scale + offset for x in values]
+
+
 def get_ip(ifaces=['wlan0', 'eth0']):
     """
     Get IP address
@@ -81,41 +271,122 @@ def get_ip(ifaces=['wlan0', 'eth0']):
     """
     if isinstance(ifaces, str):
         ifaces = [ifaces]
+    now = time.monotonic()
     for iface in list(ifaces):
-        search_str = 'ip addr show {}'.format(iface)
-        result = os.popen(search_str).read()
-        com = re.compile(r'(?<=inet )(.*)(?=\/)', re.M)
-        ipv4 = re.search(com, result)
+        cached = _ip_cache.get(iface)
+        if cached is not None and now - cached[0] < IP_CACHE_TIME:
+            ipv4 = cached[1]
+        else:
+            ipv4 = _get_iface_ip(iface)
+            _ip_cache[iface] = (now, ipv4)
         if ipv4:
-            ipv4 = ipv4.groups()[0]
             return ipv4
     return False
 
 
-def reset_mcu():
+def _get_iface_ip(iface):
+    """
+    Get IPv4 address of a network interface from the kernel
+
+    Falls back to parsing "ip addr show" if the ioctl fails otherwise.
+
+    :param iface: interface name
+    :type iface: str
+    :return: IP address or None if the interface has none
+    :rtype: str/None
+    """
+    try:
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+            request = struct.pack('256s', iface[:15].encode())
+            result = fcntl.ioctl(s.fileno(), SIOCGIFADDR, request)
+        # struct ifreq: 16 bytes name, then sockaddr_in with the address
+        # after its family and port
+        return socket.inet_ntoa(result[20:24])
+    except OSError as e:
+        if e.errno in (errno.ENODEV, errno.EADDRNOTAVAIL):
+            # no such interface, or no IPv4 address on it
+            return None
+
+    try:
+        result = subprocess.run(['ip', 'addr', 'show', iface],
+                                capture_output=True).stdout
+    except OSError:
+        return None
+    # match the raw output, only the address gets decoded
+    ipv4 = _INET_RE.search(result)
+    if ipv4:
+        return ipv4.group(1).decode()
+    return None
+
+
+def _busy_wait(seconds):
+    """
+    Wait precisely for a short time, without giving up the CPU
+
+    :param seconds: time to wait(s)
+    :type seconds: float
+    """
+    deadline = time.perf_counter_ns() + int(seconds * 1e9)
+    while time.perf_counter_ns() < deadline:
+        pass
+
+
+def reset_mcu(precise=True):
     """
     Reset mcu on Robot Hat.
 
     This is helpful if the mcu somehow stuck in a I2C data
     transfer loop, and Raspberry Pi getting IOError while
     Reading ADC, manipulating PWM, etc.
+
+    :param precise: hold the reset pin low for exactly MCU_RESET_PULSE with
+        a busy wait, instead of a 10ms sleep
+    :type precise: bool
     """
     mcu_reset = Pin("MCURST")
     mcu_reset.off()
-    time.sleep(0.01)
+    if precise:
+        _busy_wait(MCU_RESET_PULSE)
+    else:
+        time.sleep(0.01)
     mcu_reset.on()
+    # let the mcu boot before it is talked to
     time.sleep(0.01)
+    # timers are back to their reset values, PWM must program them again
+    from .pwm import timer
+    for t in timer:
+        t["psc"] = None
 
 
-def get_battery_voltage():
+def get_battery_voltage(max_age=0.2):
     """
     Get battery voltage
 
+    Battery voltage changes slowly, readings younger than max_age are
+    reused instead of reading the ADC again, and readings close together
+    are smoothed with an exponential moving average.
+
+    :param max_age: time(s) a reading is reused, 0 to always read
+    :type max_age: float
     :return: battery voltage(V)
     :rtype: float
     """
-    from .adc import ADC
-    adc = ADC("A4")
-    raw_voltage = adc.read_voltage()
-    voltage = raw_voltage * 3
+    global _adc_obj, _battery_time, _battery_voltage
+    # one ADC object for all calls, a new one per call would add a logger
+    # handler each time. The lock guards it and the cached average
+    with _adc_lock:
+        now = time.monotonic()
+        if _battery_time is not None:
+            age = now - _battery_time
+            if age < max_age:
+                return _battery_voltage
+        if _adc_obj is None:
+            from .adc import ADC
+            _adc_obj = ADC("A4")
+        voltage = _adc_obj.read_voltage() * 3
+        if _battery_time is not None and age < BATTERY_SMOOTHING_TIME:
+            voltage = (_battery_voltage * (1 - BATTERY_SMOOTHING)
+                       + voltage * BATTERY_SMOOTHING)
+        _battery_time = now
+        _battery_voltage = voltage
     return voltage
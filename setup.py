@@ -86,13 +86,18 @@ def run_command(cmd=""):
     import subprocess
     p = subprocess.Popen(
         cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-    result = p.stdout.read().decode('utf-8')
-    status = p.poll()
+    result = p.communicate()[0].decode('utf-8')
+    status = p.returncode
     return status, result
 
 errors = []
 at_work_tip_sw = False
+# the spinner is drawn with escape codes, which only make sense on a
+# terminal, not in a log or pipe
+use_escape_codes = sys.stdout.isatty() and 'NO_COLOR' not in os.environ
 def working_tip():
+    if not use_escape_codes:
+        return
     char = ['/', '-', '\\', '|']
     i = 0
     global at_work_tip_sw
@@ -191,6 +196,7 @@ if sys.argv[1] == 'install':
     except Exception as e:
         print(e)
     finally:
-        sys.stdout.write(' \033[1D')
-        sys.stdout.write('\033[?25h') # cursor visible 
-        sys.stdout.flush()
\ No newline at end of file
+        if use_escape_codes:
+            sys.stdout.write(' \033[1D')
+            sys.stdout.write('\033[?25h') # cursor visible 
+            sys.stdout.flush()
\ No newline at end of file